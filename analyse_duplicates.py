@@ -1,58 +1,85 @@
 import pandas as pd
 
 
-def check_duplicates(df: pd.DataFrame) -> None:
+def _list_columns(df: pd.DataFrame) -> list[str]:
+    """
+    Find columns containing lists by probing the first non-null value of each
+    object column, instead of scanning every cell.
+
+    Args:
+        df: DataFrame to inspect
+    """
+    return [
+        col
+        for col in df.select_dtypes(include="object").columns
+        if isinstance(next(iter(df[col].dropna().head(1)), None), list)
+    ]
+
+
+def check_duplicates(df: pd.DataFrame) -> list[str]:
     """
     Check for duplicates in a DataFrame that contains list columns.
-    Creates copies with and without list columns to analyze duplicates.
+    Compares rows with list columns ignored and with list columns stringified.
 
     Args:
         df: DataFrame to check for duplicates
+
+    Returns:
+        The list columns found, to be reused by analyze_false_duplicates
     """
     # Find columns containing lists
-    list_cols = [
-        col for col in df.columns if df[col].apply(lambda x: isinstance(x, list)).any()
-    ]
+    list_cols = _list_columns(df)
     print(f"Columns with lists: {list_cols}")
 
     # Check duplicates ignoring list columns
-    df_no_lists = df.copy()
-    df_no_lists.drop(columns=list_cols, inplace=True)
-    dup_count = df_no_lists.duplicated().sum()
+    scalar_cols = [col for col in df.columns if col not in list_cols]
+    dup_count = df[scalar_cols].duplicated().sum()
     print(f"Number of duplicate rows (not considering list columns): {dup_count}")
 
     # Check duplicates with stringified lists
-    df_str = df.copy()
-    for col in list_cols:
-        df_str[col] = df_str[col].apply(lambda x: str(x) if isinstance(x, list) else x)
-
-    duplicates = df_str.duplicated()
+    stringified = df[list_cols].astype(str)
+    duplicates = pd.concat([df[scalar_cols], stringified], axis=1).duplicated()
     print(f"Number of duplicate rows: {duplicates.sum()}")
 
+    return list_cols
+
 
-def analyze_false_duplicates(df: pd.DataFrame, output_file: str) -> None:
+def analyze_false_duplicates(
+    df: pd.DataFrame, output_file: str, list_cols: list[str] | None = None
+) -> None:
     """
     Analyze records that appear as duplicates in scalar columns but have differences in list columns.
     Writes findings to duplicate_records_report.txt
 
     Args:
         df: DataFrame containing the records to analyze
+        output_file: Path of the report, without the .txt extension
+        list_cols: Columns containing lists; detected from df if not given
     """
-    # Create copy with no list columns to check scalar duplicates
-    list_cols = [
-        col for col in df.columns if df[col].apply(lambda x: isinstance(x, list)).any()
-    ]
-    df_no_lists = df.copy()
-    df_no_lists.drop(columns=list_cols, inplace=True)
-
-    # Create copy with stringified lists to check full duplicates
-    df_str = df.copy()
-    for col in list_cols:
-        df_str[col] = df_str[col].apply(lambda x: str(x) if isinstance(x, list) else x)
+    if list_cols is None:
+        list_cols = _list_columns(df)
+
+    # Hash each row once for the scalar columns and once for the stringified
+    # list columns, so the scalar part is not rehashed for the full check
+    scalar_cols = [col for col in df.columns if col not in list_cols]
+    stringified = df[list_cols].astype(str)
+
+    # Hash factorized codes rather than raw values: hashing object columns
+    # stringifies them, which would make 1 and "1" look like duplicates
+    scalar_codes = pd.DataFrame(
+        {col: pd.factorize(df[col])[0] for col in scalar_cols}, index=df.index
+    )
+    h_scalar = pd.util.hash_pandas_object(scalar_codes, index=False)
+    if list_cols:
+        h_lists = pd.util.hash_pandas_object(stringified, index=False)
+        h_full = h_scalar ^ h_lists
+    else:
+        # hash_pandas_object rejects a frame without columns
+        h_full = h_scalar
 
     # Find the "false duplicates" - duplicate in scalar columns but different in list columns
-    false_dup_mask = df_no_lists.duplicated(keep=False) & ~df_str.duplicated(keep=False)
-    false_dups = df[false_dup_mask]
+    false_dup_mask = h_scalar.duplicated(keep=False) & ~h_full.duplicated(keep=False)
+    false_dups = df[false_dup_mask.to_numpy()]
 
     print(f"Number of 'false duplicate' rows: {len(false_dups)}")
     print(
@@ -61,32 +88,28 @@ def analyze_false_duplicates(df: pd.DataFrame, output_file: str) -> None:
 
     report_rows = []
 
-    # For each unique idUnico value
-    for id_unico in false_dups["idUnico"].unique():
-        # Get all rows with this idUnico
-        example_rows = df[df["idUnico"] == id_unico]
+    # Group all rows of each false-duplicate idUnico in a single pass.
+    # Rows are selected by position, so repeated index labels are fine
+    example_mask = df["idUnico"].isin(false_dups["idUnico"].unique()).to_numpy()
+    example_df = df[example_mask]
+
+    # Distinct list values per idUnico, counted once on the stringified lists
+    n_distinct = (
+        stringified[example_mask]
+        .groupby(example_df["idUnico"].to_numpy(), sort=False)
+        .nunique()
+    )
 
+    for id_unico, example_rows in example_df.groupby("idUnico", sort=False):
         # Check which list columns differ
-        list_cols = [
-            "tomadores",
-            "executores",
-            "repassadores",
-            "eixos",
-            "tipos",
-            "subTipos",
-            "fontesDeRecurso",
-        ]
-
-        differing_cols = []
-        col_values = {}
-
-        for col in list_cols:
-            unique_values = example_rows[col].apply(str).unique()
-            if len(unique_values) > 1:
-                differing_cols.append(col)
-                col_values[col] = []
-                for i, row in example_rows.iterrows():
-                    col_values[col].append({"row_index": i, "value": row[col]})
+        differing_cols = [col for col in list_cols if n_distinct.at[id_unico, col] > 1]
+        col_values = {
+            col: [
+                {"row_index": i, "value": value}
+                for i, value in example_rows[col].items()
+            ]
+            for col in differing_cols
+        }
 
         report_rows.append(
             {
@@ -96,21 +119,25 @@ def analyze_false_duplicates(df: pd.DataFrame, output_file: str) -> None:
             }
         )
 
-    # Write report to file
+    # Build the report in memory and write it to file in one go
+    parts = [
+        "Report of Records with Differing List Values\n",
+        "==========================================\n\n",
+    ]
+
+    for row in report_rows:
+        parts.append(f"idUnico: {row['idUnico']}\n")
+        parts.append(
+            "Differing columns: " + ", ".join(row["differing_columns"]) + "\n\n"
+        )
+
+        for col in row["differing_columns"]:
+            parts.append(f"{col}:\n")
+            for val in row["values"][col]:
+                parts.append(f"  Row {val['row_index']}: {val['value']}\n")
+        parts.append("\n" + "=" * 50 + "\n\n")
+
     with open(f"{output_file}.txt", "w") as f:
-        f.write("Report of Records with Differing List Values\n")
-        f.write("==========================================\n\n")
-
-        for row in report_rows:
-            f.write(f"idUnico: {row['idUnico']}\n")
-            f.write(
-                "Differing columns: " + ", ".join(row["differing_columns"]) + "\n\n"
-            )
-
-            for col in row["differing_columns"]:
-                f.write(f"{col}:\n")
-                for val in row["values"][col]:
-                    f.write(f"  Row {val['row_index']}: {val['value']}\n")
-            f.write("\n" + "=" * 50 + "\n\n")
+        f.write("".join(parts))
 
     print(f"Report written to duplicate_records_report.txt")
@@ -1,8 +1,123 @@
 import json
+import sqlite3
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
+
+VIACEP_WORKERS = 20
+NOMINATIM_INTERVAL = 1.1  # seconds; Nominatim allows at most 1 req/sec
+NEGATIVE_TTL = 30 * 24 * 3600  # seconds before a CEP without coords is retried
+CACHE_VERSION = 2  # bump whenever the cep_cache schema changes
+
+# Shared keep-alive session, so repeated calls skip the TCP + TLS handshake
+_session = requests.Session()
+_session.headers["User-Agent"] = "LabLivre-Analysis/1.0 (gustavo@arcos.org.br)"
+_session.headers["Accept-Encoding"] = "gzip"
+_session.mount(
+    "https://",
+    HTTPAdapter(pool_connections=VIACEP_WORKERS, pool_maxsize=VIACEP_WORKERS),
+)
+
+_next_nominatim_at = 0.0
+_nominatim_lock = threading.Lock()
+
+
+def _wait_for_nominatim() -> None:
+    """Block until the next Nominatim request is allowed."""
+    global _next_nominatim_at
+    with _nominatim_lock:
+        wait = _next_nominatim_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        _next_nominatim_at = time.monotonic() + NOMINATIM_INTERVAL
+
+
+def _open_cache(output_path: str) -> sqlite3.Connection:
+    """Open the SQLite cache next to output_path, seeded from it if it exists."""
+    conn = sqlite3.connect(Path(output_path).with_suffix(".db"))
+
+    # The JSON file is the source of truth, so a cache with an older schema is
+    # dropped and reseeded from it below instead of being migrated
+    if conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+        conn.execute("DROP TABLE IF EXISTS cep_cache")
+        conn.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cep_cache "
+        "(cep TEXT PRIMARY KEY, lat REAL, lon REAL, "
+        "fetched_at INTEGER, status TEXT, etag TEXT, address TEXT)"
+    )
+
+    if Path(output_path).exists():
+        # The file does not record when each CEP was fetched; use its mtime
+        fetched_at = int(Path(output_path).stat().st_mtime)
+        with open(output_path) as f:
+            rows = [
+                (cep, lat, lon, fetched_at, _status(lat), None, None)
+                for cep, (lat, lon) in json.load(f).items()
+            ]
+        conn.executemany(
+            "INSERT OR IGNORE INTO cep_cache VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        conn.commit()
+
+    return conn
+
+
+def _status(lat: float | None) -> str:
+    """'ok' for a result with coordinates, 'error' for a negative one."""
+    return "ok" if lat is not None else "error"
+
+
+def _cache_all(conn: sqlite3.Connection) -> dict[str, tuple]:
+    """Read the whole cache as a {cep: (lat, lon)} dict in a single query."""
+    rows = conn.execute("SELECT cep, lat, lon FROM cep_cache").fetchall()
+    return {cep: (lat, lon) for cep, lat, lon in rows}
+
+
+def _cache_stale(conn: sqlite3.Connection) -> set[str]:
+    """CEPs with a negative result older than NEGATIVE_TTL, to be looked up again."""
+    rows = conn.execute(
+        "SELECT cep FROM cep_cache WHERE status = 'error' AND fetched_at < ?",
+        (int(time.time()) - NEGATIVE_TTL,),
+    ).fetchall()
+    return {cep for (cep,) in rows}
+
+
+def _cache_viacep(conn: sqlite3.Connection) -> dict[str, tuple[str, dict]]:
+    """ETag and address of the ViaCEP responses the cached results came from."""
+    rows = conn.execute(
+        "SELECT cep, etag, address FROM cep_cache "
+        "WHERE etag IS NOT NULL AND address IS NOT NULL"
+    ).fetchall()
+    return {cep: (etag, json.loads(address)) for cep, etag, address in rows}
+
+
+def _cache_set(
+    conn: sqlite3.Connection,
+    cep: str,
+    result: tuple,
+    etag: str | None = None,
+    address: dict | None = None,
+) -> None:
+    """Write a single (lat, lon) result to the cache."""
+    lat, lon = result
+    address_json = json.dumps(address) if address is not None else None
+    conn.execute(
+        "INSERT OR REPLACE INTO cep_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (cep, lat, lon, int(time.time()), _status(lat), etag, address_json),
+    )
+    conn.commit()
+
+
+def _export_cache(cache: dict[str, tuple], output_path: str) -> None:
+    """Write the whole cache to output_path as JSON, once per run."""
+    with open(output_path, "w") as f:
+        json.dump(cache, f)
 
 
 def cep_to_coords_viacep(
@@ -10,56 +125,72 @@ def cep_to_coords_viacep(
 ) -> None:
     """Geocode CEP using ViaCEP + Nominatim. Saves to file."""
 
-    # Load cache from same file
-    cache = {}
-    if Path(output_path).exists():
-        with open(output_path) as f:
-            cache = json.load(f)
-
-    def cep_to_coords_viacep_single(cep):
-        """Geocode CEP using ViaCEP + Nominatim"""
-        # Check cache first
-        if cep in cache:
-            return cache[cep]
+    # Load cache, seeded from the output file
+    conn = _open_cache(output_path)
+    cache = _cache_all(conn)
+    stale = _cache_stale(conn)
+    viacep_cache = _cache_viacep(conn)
 
+    def fetch_viacep(cep):
+        """Get the address of a CEP from ViaCEP, with its ETag"""
         cep_clean = cep.replace("-", "")
         via_url = f"https://viacep.com.br/ws/{cep_clean}/json/"
-        addr = requests.get(via_url).json()
 
+        # Conditional GET: on 304 the stored address is still current
+        headers = {}
+        if cep in viacep_cache:
+            headers["If-None-Match"] = viacep_cache[cep][0]
+        response = _session.get(via_url, headers=headers, timeout=5)
+
+        if response.status_code == 304:
+            return viacep_cache[cep][1], viacep_cache[cep][0]
+        return response.json(), response.headers.get("ETag")
+
+    def geocode_nominatim(addr):
+        """Geocode a ViaCEP address using Nominatim"""
         if "erro" in addr:
-            result = (None, None)
-        else:
-            query = f"{addr.get('logradouro', '')}, {addr.get('localidade', '')}, DF, Brazil"
-            nom_url = "https://nominatim.openstreetmap.org/search"
-
-            # Comply: User-Agent + 1 req/sec
-            time.sleep(1.1)  # Rate limit
-            geo = requests.get(
-                nom_url,
-                params={"q": query, "format": "json", "limit": 1},
-                headers={"User-Agent": "gustavo@arcos.org.br"},
-            ).json()
-
-            result = (
-                (float(geo[0]["lat"]), float(geo[0]["lon"])) if geo else (None, None)
-            )
-
-        # Cache result
-        cache[cep] = result
-        with open(output_path, "w") as f:
-            json.dump(cache, f)
+            return (None, None)
 
-        return result
+        # Structured query, cheaper for Nominatim to resolve than free text.
+        # General CEPs have no logradouro, so empty fields are left out.
+        address = {
+            "street": addr.get("logradouro"),
+            "city": addr.get("localidade"),
+            "state": addr.get("uf", "DF"),
+            "country": "Brazil",
+        }
+        params = {k: v for k, v in address.items() if v}
+        params.update({"format": "json", "limit": 1})
+        nom_url = "https://nominatim.openstreetmap.org/search"
 
-    # Get coordinates for each CEP
-    coords_dict = {}
-    for cep in ceps:
-        try:
-            lat, lon = cep_to_coords_viacep_single(cep)
-            coords_dict[cep] = (lat, lon)
-        except Exception as e:
-            print(f"Error processing CEP {cep}: {e}")
-            coords_dict[cep] = (None, None)
+        # Comply: User-Agent (set on the session) + 1 req/sec.
+        # Only waits for the time left since the previous Nominatim call.
+        _wait_for_nominatim()
+        geo = _session.get(nom_url, params=params, timeout=10).json()
+
+        return (float(geo[0]["lat"]), float(geo[0]["lon"])) if geo else (None, None)
+
+    # ViaCEP has no documented rate limit, so addresses are fetched in parallel.
+    # Nominatim calls stay serial in this thread, overlapping with the fetches.
+    # Negative results are retried once they are older than NEGATIVE_TTL.
+    pending = [cep for cep in dict.fromkeys(ceps) if cep not in cache or cep in stale]
+    with ThreadPoolExecutor(max_workers=VIACEP_WORKERS) as executor:
+        futures = {executor.submit(fetch_viacep, cep): cep for cep in pending}
+        for future in as_completed(futures):
+            cep = futures[future]
+            try:
+                addr, etag = future.result()
+                result = geocode_nominatim(addr)
+            except Exception as e:
+                print(f"Error processing CEP {cep}: {e}")
+                continue
+
+            # Cache result
+            cache[cep] = result
+            _cache_set(conn, cep, result, etag, addr)
+
+    _export_cache(cache, output_path)
+    conn.close()
 
 
 def cep_to_coords_ipedf(
@@ -68,23 +199,22 @@ def cep_to_coords_ipedf(
 ) -> None:
     """Geocode CEP using DF government's API. Saves to file."""
 
-    # Load cache from same file
-    cache = {}
-    if Path(output_path).exists():
-        with open(output_path) as f:
-            cache = json.load(f)
+    # Load cache, seeded from the output file
+    conn = _open_cache(output_path)
+    cache = _cache_all(conn)
+    stale = _cache_stale(conn)
 
     def cep_to_coords_ipedf_single(cep):
         """Geocode CEP directly using DF government's API"""
-        # Check cache first
-        if cep in cache:
+        # Check cache first, retrying negative results older than NEGATIVE_TTL
+        if cep in cache and cep not in stale:
             return cache[cep]
 
         try:
             url = "https://geocode.ipe.df.gov.br/api/"
             params = {"localidade": cep, "limite": 1}
 
-            response = requests.get(url, params=params, timeout=5)
+            response = _session.get(url, params=params, timeout=5)
             response.raise_for_status()
             data = response.json()
 
@@ -96,8 +226,7 @@ def cep_to_coords_ipedf(
 
             # Cache the result
             cache[cep] = result
-            with open(output_path, "w") as f:
-                json.dump(cache, f)
+            _cache_set(conn, cep, result)
 
             return result
 
@@ -111,13 +240,12 @@ def cep_to_coords_ipedf(
         result = (None, None)
         # Cache the failed result too
         cache[cep] = result
-        with open(output_path, "w") as f:
-            json.dump(cache, f)
+        _cache_set(conn, cep, result)
         return result
 
-    # Get coordinates for each CEP
+    # Get coordinates for each unique CEP
     coords_dict = {}
-    for cep in ceps:
+    for cep in dict.fromkeys(ceps):
         try:
             lat, lon = cep_to_coords_ipedf_single(cep)
             coords_dict[cep] = (lat, lon)
@@ -125,6 +253,9 @@ def cep_to_coords_ipedf(
             print(f"Error processing CEP {cep}: {e}")
             coords_dict[cep] = (None, None)
 
+    _export_cache(cache, output_path)
+    conn.close()
+
 
 # if __name__ == "__main__":
 #     ceps = ["70297400", "70000000", "70800120"]
@@ -1,8 +1,11 @@
 import json
-import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
+MAX_PAGES = 100
+WORKERS = 10
+
 
 def get_data(page: int) -> dict:
     url = "https://api.obrasgov.gestao.gov.br/obrasgov/api/projeto-investimento"
@@ -17,20 +20,37 @@ def get_data(page: int) -> dict:
     return response.json()
 
 
-def main():
-    # inelegant but expedient. surely they dont have 10000 items
-    for page in range(100):
-        response = get_data(page)
-        print(f"Page {page} processed")
-
-        # save raw data first so if there are issues, we don't depend on the api
-        with open(f"data/data-{page}.json", "w", encoding="utf-8") as f:
-            json.dump(response["content"], f, indent=4)
-        print(f"Data saved to data/data-{page}.json")
+def save_page(page: int, content: list) -> None:
+    # save raw data first so if there are issues, we don't depend on the api
+    with open(f"data/data-{page}.json", "w", encoding="utf-8") as f:
+        json.dump(content, f)
+    print(f"Data saved to data/data-{page}.json")
 
-        time.sleep(1)
 
-        page += 1
+def main():
+    first = get_data(0)
+    print("Page 0 processed")
+    save_page(0, first["content"])
+
+    # the response is paginated (spring style, either flat or under "page"),
+    # so stop at the last page it reports. without that metadata fall back to
+    # the old cap: inelegant but expedient. surely they dont have 10000 items.
+    page_info = first.get("page", first)
+    total_pages = page_info.get("totalPages", MAX_PAGES)
+
+    # pages are fetched WORKERS at a time, stopping after the first empty one
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        for start in range(1, total_pages, WORKERS):
+            pages = range(start, min(start + WORKERS, total_pages))
+
+            for page, response in zip(pages, executor.map(get_data, pages)):
+                content = response["content"]
+                if not content:
+                    print(f"Page {page} is empty, stopping")
+                    return
+
+                print(f"Page {page} processed")
+                save_page(page, content)
 
 
 if __name__ == "__main__":